@@ -1,92 +1,312 @@
 import os
-import sqlite3
-from typing import Optional
+import hmac
+import hashlib
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Annotated, List, Optional
 from datetime import datetime
 
-from fastapi import FastAPI, Query, Header, HTTPException
-from fastapi.responses import PlainTextResponse
+import aiosqlite
+import msgspec
+import httpx
+import orjson
+from aiosqlitepool import SQLiteConnectionPool
+from fastapi import FastAPI, Query, Header, HTTPException, Request, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.openapi.utils import get_openapi
+from slowapi import Limiter, _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
+from slowapi.util import get_remote_address
 
 from mcp.tools import thepusherrr, spotify
 from mcp.config import (
     SPOTIFY_CLIENT_ID,
     SPOTIFY_CLIENT_SECRET,
     SPOTIFY_REDIRECT_URI,
+    USER_KEYS,
+    validate as validate_config,
 )
-from mcp.utils import get_user_state, add_to_queue, set_last_played, set_online
+from mcp.utils import QueueFull, enqueue, set_last_played, set_online, open_redis, close_redis
+
+class ORJSONResponse(JSONResponse):
+    # local equivalent of the (deprecated) fastapi.responses.ORJSONResponse
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+_logger = logging.getLogger(__name__)
 
 # --- Logging / identity setup ------------------------------------------------
 DB_PATH = os.getenv("LOG_DB_PATH", "actions.db")
-AIDAN_API_KEY = os.environ.get("AIDAN_API_KEY", "")
-
-def _init_db():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    c = conn.cursor()
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS action_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            actor TEXT,
-            endpoint TEXT,
-            params TEXT,
-            result TEXT
-        )
-        """
-    )
-    conn.commit()
+_USER_KEY_BYTES = tuple((name, key.encode()) for key, name in USER_KEYS.items())
+
+async def _connect_db():
+    conn = await aiosqlite.connect(DB_PATH, cached_statements=256)
+    # append-only log: WAL + NORMAL avoids an fsync of the whole DB per commit
+    await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute("PRAGMA synchronous=NORMAL")
+    await conn.execute("PRAGMA temp_store=MEMORY")
+    await conn.execute("PRAGMA mmap_size=268435456")
     return conn
 
-_db_conn = _init_db()
+async def _init_db(pool: SQLiteConnectionPool):
+    async with pool.connection() as conn:
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS action_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT,
+                actor TEXT,
+                endpoint TEXT,
+                params TEXT,
+                result TEXT
+            )
+            """
+        )
+        await conn.commit()
+
+_LOG_INSERT = "INSERT INTO action_log (timestamp, actor, endpoint, params, result) VALUES (?, ?, ?, ?, ?)"
+_LOG_COLUMNS = ("timestamp", "actor", "endpoint", "params", "result")
+_LOGS_SELECT = f"SELECT {', '.join(_LOG_COLUMNS)} FROM action_log ORDER BY id DESC LIMIT ?"
+_LOG_BATCH_MAX = 200
+_LOG_BATCH_WINDOW = 0.1  # seconds to keep collecting rows after the first arrives
 
 def log_action(actor: str, endpoint: str, params: str, result: str):
+    # non-blocking: rows are persisted by _log_writer off the request path. The
+    # queue belongs to the running lifespan (and its event loop); without one
+    # there is no writer, so the row is dropped.
+    queue = getattr(app.state, "log_queue", None)
+    if queue is not None:
+        queue.put_nowait((datetime.utcnow().isoformat(), actor, endpoint, params, result))
+
+async def _write_log_batch(pool: SQLiteConnectionPool, batch: list):
     try:
-        c = _db_conn.cursor()
-        c.execute(
-            "INSERT INTO action_log (timestamp, actor, endpoint, params, result) VALUES (?, ?, ?, ?, ?)",
-            (datetime.utcnow().isoformat(), actor, endpoint, params, result),
-        )
-        _db_conn.commit()
-    except Exception:
-        pass
+        async with pool.connection() as conn:
+            await conn.executemany(_LOG_INSERT, batch)
+            await conn.commit()
+    except Exception as e:
+        # lazy %-format and no traceback unless debugging; logging must never break requests
+        _logger.warning("action log write failed (%d rows): %s", len(batch), e)
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug("action log write failure", exc_info=True)
+
+async def _log_writer(pool: SQLiteConnectionPool, queue: asyncio.Queue):
+    # a None entry is the shutdown sentinel; everything queued before it is flushed
+    while True:
+        batch = [await queue.get()]
+        deadline = asyncio.get_running_loop().time() + _LOG_BATCH_WINDOW
+        while batch[-1] is not None and len(batch) < _LOG_BATCH_MAX:
+            if queue.empty():
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            else:
+                batch.append(queue.get_nowait())
+        rows = [row for row in batch if row is not None]
+        if rows:
+            await _write_log_batch(pool, rows)
+        if len(rows) != len(batch):
+            return
 
 def identify_actor(api_key: Optional[str]) -> str:
-    if api_key and api_key == AIDAN_API_KEY:
-        return "Aidan"
+    # constant-time compare against every known key; not cached, so raw
+    # client-supplied keys are never kept around in memory
+    candidate = (api_key or "").encode()
+    for name, key in _USER_KEY_BYTES:
+        if hmac.compare_digest(candidate, key):
+            return name
     return "other"
 
+async def get_actor(x_api_key: Annotated[Optional[str], Header()] = None) -> str:
+    # async so FastAPI resolves it on the event loop rather than the threadpool
+    return identify_actor(x_api_key)
+
+# Declared once and shared by every route; FastAPI resolves it once per request
+Actor = Annotated[str, Depends(get_actor)]
+
+# --- Parameter bundles -----------------------------------------------------------
+# Built by async functions: a class used directly in Depends() would be
+# instantiated in the threadpool on every request.
+def _split_csv(s: Optional[str]) -> List[str]:
+    # the common single-value case skips the split + comprehension
+    if not s:
+        return []
+    if "," not in s:
+        s = s.strip()
+        return [s] if s else []
+    return [u.strip() for u in s.split(",") if u.strip()]
+
+@dataclass
+class RecommendParams:
+    seed_tracks: List[str]
+    seed_artists: List[str]
+    seed_genres: List[str]
+    limit: int
+
+async def recommend_params(
+    seed_tracks: Optional[str] = Query(None, description="Comma-separated track URIs"),
+    seed_artists: Optional[str] = Query(None, description="Comma-separated artist URIs"),
+    seed_genres: Optional[str] = Query(None, description="Comma-separated genres"),
+    limit: int = Query(10, ge=1, le=100),
+) -> RecommendParams:
+    # URI prefixes are stripped once, in spotify.get_recommendations
+    return RecommendParams(_split_csv(seed_tracks), _split_csv(seed_artists), _split_csv(seed_genres), limit)
+
+@dataclass
+class NewPlaylistParams:
+    name: str
+    description: str
+    public: bool
+
+async def new_playlist_params(
+    name: str = Query(...),
+    description: str = Query(""),
+    public: bool = Query(False),
+) -> NewPlaylistParams:
+    return NewPlaylistParams(name, description, public)
+
+@dataclass
+class AddTracksParams:
+    playlist_id: str
+    track_uris: List[str]
+
+async def add_tracks_params(
+    playlist_id: str = Query(...),
+    track_uris: str = Query(..., description="Comma-separated track URIs"),
+) -> AddTracksParams:
+    return AddTracksParams(playlist_id, _split_csv(track_uris))
+
+def _conditional_response(request: Request, payload) -> Response:
+    # read-mostly payloads: let clients revalidate with If-None-Match and get a 304
+    body = orjson.dumps(payload)
+    etag = '"' + hashlib.md5(body).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=120", "Vary": "x-api-key"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Spotify failures map to a 500, except a missing/revoked token which is a 401
+_UNAUTH = {"error": "not authenticated", "action": "visit /auth/start to authenticate"}
+_UNAUTH_BYTES = orjson.dumps(_UNAUTH)
+
+def _spotify_error(e: Exception) -> Exception:
+    if isinstance(e, spotify.NotAuthenticated):
+        return e
+    return HTTPException(status_code=500, detail=f"spotify error: {e}")
+
+# --- Track shaping ---------------------------------------------------------------
+class TrackOut(msgspec.Struct):
+    name: Optional[str]
+    artists: List[Optional[str]]
+    uri: Optional[str]
+
+_track_encoder = msgspec.json.Encoder()
+
+def _tracks_response(tracks: list) -> Response:
+    # typed structs encode straight to bytes, skipping jsonable_encoder
+    out = [
+        TrackOut(t.get("name"), [a.get("name") for a in t.get("artists") or ()], t.get("uri"))
+        for t in tracks
+    ]
+    return Response(content=_track_encoder.encode({"tracks": out}), media_type="application/json")
+
+# --- Rate limiting -------------------------------------------------------------
+# Protects Spotify/Pushover quotas; the owner is keyed by identity, others by IP
+RATE_LIMIT = os.getenv("RATE_LIMIT", "30/minute")
+
+def _rate_limit_key(request: Request) -> str:
+    actor = identify_actor(request.headers.get("x-api-key"))
+    if actor == "Aidan":
+        return actor
+    return get_remote_address(request)
+
+limiter = Limiter(key_func=_rate_limit_key)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # all per-worker startup lives here so imports stay side-effect free
+    try:
+        validate_config()
+    except ValueError as e:
+        # the API still serves health checks and notifications without Spotify
+        _logger.warning("config incomplete: %s", e)
+    app.state.db_pool = SQLiteConnectionPool(_connect_db)
+    await _init_db(app.state.db_pool)
+    # created here so the queue is bound to this lifespan's event loop
+    log_queue = app.state.log_queue = asyncio.Queue()
+    log_writer = asyncio.create_task(_log_writer(app.state.db_pool, log_queue))
+    # one keep-alive pool shared by Spotify and Pushover calls
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=64, max_connections=128),
+        timeout=httpx.Timeout(10.0),
+    )
+    spotify.open_http(app.state.http)
+    open_redis()
+    # the schema is static once routes are registered; build and encode it once
+    app.openapi_schema = custom_openapi()
+    app.openapi = lambda: app.openapi_schema
+    app.state.openapi_bytes = orjson.dumps(app.openapi_schema)
+    try:
+        yield
+    finally:
+        await close_redis()
+        await spotify.close_http()
+        await app.state.http.aclose()
+        app.state.log_queue = None
+        log_queue.put_nowait(None)
+        await log_writer
+        await app.state.db_pool.close()
+
 app = FastAPI(
     title="MCP (Multi-Control Panel) API",
     description="An interface to control Spotify and send notifications. You can play playlists, tracks, start radios, resume/skip, get current song, and push custom messages.",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
+app.state.limiter = limiter
+app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+
+@app.exception_handler(spotify.NotAuthenticated)
+async def not_authenticated(request: Request, exc: spotify.NotAuthenticated):
+    # body is encoded once; the Response is per request since middleware
+    # may add headers to it
+    return Response(_UNAUTH_BYTES, status_code=401, media_type="application/json")
 
 # Basic health checks
+# The root payload never changes, so it is encoded once at import
+_ROOT_BYTES = orjson.dumps({"status": "MCP API is running"})
+
 @app.head("/", include_in_schema=False)
-def head_root():
+async def head_root():
     return PlainTextResponse("", status_code=200)
 
 @app.get("/", summary="Root")
-def root(x_api_key: Optional[str] = Header(default=None)):
-    actor = identify_actor(x_api_key)
+async def root(actor: Actor):
     log_action(actor, "health_check", "", "root endpoint hit")
-    return {"status": "MCP API is running"}
+    return Response(content=_ROOT_BYTES, media_type="application/json")
 
 # Notification
 @app.get("/notify", summary="Send Notification")
-def notify(
+@limiter.limit(RATE_LIMIT)
+async def notify(
+    request: Request,
+    actor: Actor,
     msg: str = Query("hello world", description="Message to send via Pushover"),
-    x_api_key: Optional[str] = Header(default=None),
 ):
-    actor = identify_actor(x_api_key)
-    result = thepusherrr.send_notification("MCP Notification", msg)
+    result = await thepusherrr.send_notification_async("MCP Notification", msg, app.state.http)
     log_action(actor, "notify", msg, str(result))
     return {"message_sent": msg, "result": result}
 
 # Spotify auth flow
 @app.get("/auth/start")
-def auth_start(x_api_key: Optional[str] = Header(default=None)):
-    actor = identify_actor(x_api_key)
+async def auth_start(actor: Actor):
     if actor != "Aidan":
         raise HTTPException(status_code=403, detail="only Aidan can initiate auth")
     if not (SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET and SPOTIFY_REDIRECT_URI):
@@ -94,23 +314,21 @@ def auth_start(x_api_key: Optional[str] = Header(default=None)):
     return {"auth_url": spotify.get_auth_url()}
 
 @app.get("/auth/callback")
-def auth_callback(code: str, x_api_key: Optional[str] = Header(default=None)):
-    actor = identify_actor(x_api_key)
+async def auth_callback(actor: Actor, code: str):
     if actor != "Aidan":
         raise HTTPException(status_code=403, detail="forbidden")
-    token_info = spotify.handle_callback(code)
+    token_info = await asyncio.to_thread(spotify.handle_callback, code)
     log_action(actor, "auth_callback", code, str(token_info))
     return {"status": "authenticated", "expires_in": token_info.get("expires_in")}
 
-# Playback endpoints (examples: song, play, next, etc.)
+# Playback endpoints
 @app.get("/song", summary="Get Current Song")
-def current_song(x_api_key: Optional[str] = Header(default=None)):
-    actor = identify_actor(x_api_key)
+async def current_song(actor: Actor):
     try:
-        song, artist = spotify.get_current_song()
+        song, artist = await spotify.get_current_song()
     except Exception as e:
         log_action(actor, "current_song", "", str(e))
-        raise HTTPException(status_code=500, detail=f"spotify error: {e}")
+        raise _spotify_error(e)
     log_action(actor, "current_song", "", f"{song} - {artist}")
     if song and artist:
         if actor == "Aidan":
@@ -119,56 +337,277 @@ def current_song(x_api_key: Optional[str] = Header(default=None)):
         return {"song": song, "artist": artist}
     return {"message": "No song currently playing"}
 
+async def _enqueue_for_aidan(kind: str, item: str, actor: str, endpoint: str) -> dict:
+    # guests can't drive playback; their request joins Aidan's queue instead
+    try:
+        queue = await enqueue("Aidan", item, kind, actor)
+    except QueueFull:
+        log_action(actor, endpoint, item, "Aidan's queue is full")
+        raise HTTPException(status_code=429, detail="Aidan's queue is full")
+    log_action(actor, endpoint, item, f"Added to Aidan's queue: {queue}")
+    return {
+        "message": f"{actor} requested {kind}. Added to Aidan's queue.",
+        "queue_length": len(queue),
+        "queue": queue,
+    }
+
 # Example of owner vs other logic for playing a playlist
 @app.get("/play", summary="Play a Spotify playlist")
-def play(playlist: str = Query(...), x_api_key: Optional[str] = Header(default=None)):
-    actor = identify_actor(x_api_key)
-    if actor != "Aidan":
-        add_to_queue("Aidan", playlist, "playlist", actor)
-        state = get_user_state("Aidan")
-        log_action(actor, "play_playlist", playlist, f"Added to Aidan's queue: {state['queue']}")
-        return {
-            "message": f"{actor} requested playlist. Added to Aidan's queue.",
-            "queue_length": len(state["queue"]),
-            "queue": state["queue"],
-        }
-    try:
-        result = spotify.play_playlist(playlist)
+@limiter.limit(RATE_LIMIT)
+async def play(request: Request, actor: Actor, playlist: str = Query(...)):
+    if actor != "Aidan":
+        return await _enqueue_for_aidan("playlist", playlist, actor, "play_playlist")
+    try:
+        result = await spotify.play_playlist(playlist)
         log_action(actor, "play_playlist", playlist, str(result))
         return result
     except Exception as e:
         log_action(actor, "play_playlist", playlist, str(e))
-        raise HTTPException(status_code=500, detail=f"spotify error: {e}")
+        raise _spotify_error(e)
 
-# (Other Spotify endpoints would follow the same pattern...)
-# Skipping rewriting all for brevity; keep your existing handlers for next/track/search/etc.
+@app.get("/track", summary="Play a Spotify track")
+@limiter.limit(RATE_LIMIT)
+async def play_track(request: Request, actor: Actor, uri: str = Query(..., description="Spotify track URI")):
+    if actor != "Aidan":
+        return await _enqueue_for_aidan("track", uri, actor, "play_track")
+    try:
+        result = await spotify.play_track(uri)
+        log_action(actor, "play_track", uri, str(result))
+        return result
+    except Exception as e:
+        log_action(actor, "play_track", uri, str(e))
+        raise _spotify_error(e)
 
-@app.get("/logs", summary="Fetch recent logs")
-def fetch_logs(limit: int = Query(50, le=200), x_api_key: Optional[str] = Header(default=None)):
-    actor = identify_actor(x_api_key)
+@app.get("/radio", summary="Start a radio seeded by a track")
+@limiter.limit(RATE_LIMIT)
+async def play_song_radio(request: Request, actor: Actor, uri: str = Query(..., description="Seed track URI")):
+    if actor != "Aidan":
+        return await _enqueue_for_aidan("radio", uri, actor, "play_song_radio")
+    try:
+        result = await spotify.play_song_radio(uri)
+        log_action(actor, "play_song_radio", uri, str(result))
+        return result
+    except Exception as e:
+        log_action(actor, "play_song_radio", uri, str(e))
+        raise _spotify_error(e)
+
+@app.get("/next", summary="Skip to next track")
+@limiter.limit(RATE_LIMIT)
+async def next_track(request: Request, actor: Actor):
+    if actor != "Aidan":
+        raise HTTPException(status_code=403, detail="forbidden")
+    try:
+        await spotify.play_next_track()
+    except Exception as e:
+        log_action(actor, "next_track", "", str(e))
+        raise _spotify_error(e)
+    log_action(actor, "next_track", "", "skipped")
+    return {"status": "skipped"}
+
+@app.get("/previous", summary="Go back to previous track")
+async def previous(actor: Actor):
+    if actor != "Aidan":
+        raise HTTPException(status_code=403, detail="forbidden")
+    try:
+        await spotify.previous_track()
+    except Exception as e:
+        log_action(actor, "previous_track", "", str(e))
+        raise _spotify_error(e)
+    log_action(actor, "previous_track", "", "previous")
+    return {"status": "previous"}
+
+@app.get("/pause", summary="Pause playback")
+async def pause(actor: Actor):
     if actor != "Aidan":
         raise HTTPException(status_code=403, detail="forbidden")
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT timestamp, actor, endpoint, params, result FROM action_log ORDER BY id DESC LIMIT ?", (limit,)
+        await spotify.pause_playback()
+    except Exception as e:
+        log_action(actor, "pause", "", str(e))
+        raise _spotify_error(e)
+    log_action(actor, "pause", "", "paused")
+    return {"status": "paused"}
+
+@app.get("/resume", summary="Resume playback")
+async def resume(actor: Actor):
+    if actor != "Aidan":
+        raise HTTPException(status_code=403, detail="forbidden")
+    try:
+        await spotify.resume_playback()
+    except Exception as e:
+        log_action(actor, "resume", "", str(e))
+        raise _spotify_error(e)
+    log_action(actor, "resume", "", "resumed")
+    return {"status": "resumed"}
+
+@app.get("/volume", summary="Set playback volume")
+@limiter.limit(RATE_LIMIT)
+async def volume(request: Request, actor: Actor, level: int = Query(..., ge=0, le=100, description="Volume percent")):
+    if actor != "Aidan":
+        raise HTTPException(status_code=403, detail="forbidden")
+    try:
+        await spotify.set_volume(level)
+    except Exception as e:
+        log_action(actor, "volume", str(level), str(e))
+        raise _spotify_error(e)
+    log_action(actor, "volume", str(level), "ok")
+    return {"volume": level}
+
+@app.get("/search", summary="Search for tracks")
+@limiter.limit(RATE_LIMIT)
+async def search(request: Request, actor: Actor, q: str = Query(..., description="Search query"), limit: int = Query(10, ge=1, le=50)):
+    try:
+        tracks = await spotify.search_tracks(q, limit=limit)
+    except Exception as e:
+        log_action(actor, "search", q, str(e))
+        raise _spotify_error(e)
+    log_action(actor, "search", q, f"{len(tracks)} results")
+    return _tracks_response(tracks)
+
+@app.get("/recommend", summary="Get track recommendations")
+@limiter.limit(RATE_LIMIT)
+async def recommend(
+    request: Request,
+    actor: Actor,
+    p: RecommendParams = Depends(recommend_params),
+):
+    params = f"tracks={','.join(p.seed_tracks)} artists={','.join(p.seed_artists)} genres={','.join(p.seed_genres)}"
+    try:
+        tracks = await spotify.get_recommendations(
+            seed_tracks=p.seed_tracks,
+            seed_artists=p.seed_artists,
+            seed_genres=p.seed_genres,
+            limit=p.limit,
         )
-        rows = [dict(r) for r in cur.fetchall()]
-        return {"logs": rows}
+    except Exception as e:
+        log_action(actor, "recommend", params, str(e))
+        raise _spotify_error(e)
+    log_action(actor, "recommend", params, f"{len(tracks)} results")
+    return _tracks_response(tracks)
+
+@app.get("/create_playlist", summary="Create a playlist")
+async def create_playlist(
+    actor: Actor,
+    p: NewPlaylistParams = Depends(new_playlist_params),
+):
+    if actor != "Aidan":
+        raise HTTPException(status_code=403, detail="forbidden")
+    try:
+        playlist = await spotify.create_playlist(p.name, description=p.description, public=p.public)
+    except Exception as e:
+        log_action(actor, "create_playlist", p.name, str(e))
+        raise _spotify_error(e)
+    if not playlist:
+        log_action(actor, "create_playlist", p.name, "no user id")
+        raise HTTPException(status_code=500, detail="could not resolve Spotify user")
+    log_action(actor, "create_playlist", p.name, playlist.get("uri", ""))
+    return {"name": playlist.get("name"), "id": playlist.get("id"), "uri": playlist.get("uri")}
+
+@app.get("/add_to_playlist", summary="Add tracks to a playlist")
+async def add_to_playlist(
+    actor: Actor,
+    p: AddTracksParams = Depends(add_tracks_params),
+):
+    if actor != "Aidan":
+        raise HTTPException(status_code=403, detail="forbidden")
+    uris = p.track_uris
+    try:
+        result = await spotify.add_tracks_to_playlist(p.playlist_id, uris)
+    except Exception as e:
+        log_action(actor, "add_to_playlist", p.playlist_id, str(e))
+        raise _spotify_error(e)
+    log_action(actor, "add_to_playlist", p.playlist_id, str(result))
+    return {"added": len(uris), "result": result}
+
+@app.get("/me", summary="Get Spotify profile")
+async def me(request: Request, actor: Actor):
+    if actor != "Aidan":
+        raise HTTPException(status_code=403, detail="forbidden")
+    try:
+        profile = await spotify.get_user_profile()
+    except Exception as e:
+        log_action(actor, "me", "", str(e))
+        raise _spotify_error(e)
+    log_action(actor, "me", "", profile.get("id", ""))
+    return _conditional_response(request, profile)
+
+@app.get("/playlists", summary="List playlists")
+async def playlists(request: Request, actor: Actor, limit: int = Query(20, ge=1, le=500)):
+    if actor != "Aidan":
+        raise HTTPException(status_code=403, detail="forbidden")
+    try:
+        items = await spotify.get_user_playlists(limit=limit)
+    except Exception as e:
+        log_action(actor, "playlists", str(limit), str(e))
+        raise _spotify_error(e)
+    log_action(actor, "playlists", str(limit), f"{len(items)} playlists")
+    return _conditional_response(request, {"playlists": items})
+
+async def _playlist_pages(actor: str, playlist_id: str, first_page: list, pages):
+    # re-yields pages from spotify.get_playlist_tracks and logs the outcome
+    count = 0
+    page = first_page
+    try:
+        while True:
+            yield page
+            count += len(page)
+            page = await anext(pages)
+    except StopAsyncIteration:
+        log_action(actor, "playlist_tracks", playlist_id, f"{count} tracks")
+    except Exception as e:
+        log_action(actor, "playlist_tracks", playlist_id, f"aborted after {count} tracks: {e}")
+        raise
+
+async def _stream_playlist_tracks(page_iter):
+    # emits {"tracks":[...]} a page at a time so memory stays O(page size)
+    yield b'{"tracks":['
+    first = True
+    async for page in page_iter:
+        if page:
+            chunk = b",".join([orjson.dumps(t) for t in page])
+            yield chunk if first else b"," + chunk
+            first = False
+    yield b"]}"
+
+async def _stream_playlist_tracks_ndjson(page_iter):
+    # one track object per line
+    async for page in page_iter:
+        if page:
+            yield b"".join([orjson.dumps(t) + b"\n" for t in page])
+
+@app.get("/playlist_tracks", summary="Retrieve all tracks in a playlist")
+async def playlist_tracks(
+    actor: Actor,
+    playlist_id: str = Query(...),
+    ndjson: bool = Query(False, description="Stream one track per line as application/x-ndjson"),
+):
+    if actor != "Aidan":
+        raise HTTPException(status_code=403, detail="forbidden")
+    pages = spotify.get_playlist_tracks(playlist_id)
+    try:
+        # fetch the first page up front so auth/HTTP errors still map to a 500
+        first_page = await anext(pages)
+    except Exception as e:
+        log_action(actor, "playlist_tracks", playlist_id, str(e))
+        raise _spotify_error(e)
+    page_iter = _playlist_pages(actor, playlist_id, first_page, pages)
+    if ndjson:
+        return StreamingResponse(_stream_playlist_tracks_ndjson(page_iter), media_type="application/x-ndjson")
+    return StreamingResponse(_stream_playlist_tracks(page_iter), media_type="application/json")
+
+@app.get("/logs", summary="Fetch recent logs")
+async def fetch_logs(actor: Actor, limit: int = Query(50, le=200)):
+    if actor != "Aidan":
+        raise HTTPException(status_code=403, detail="forbidden")
+    try:
+        async with app.state.db_pool.connection() as conn:
+            rows = await conn.execute_fetchall(_LOGS_SELECT, (limit,))
+        return {"logs": [dict(zip(_LOG_COLUMNS, r)) for r in rows]}
     except Exception as e:
         return {"error": str(e)}
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
 
-# OpenAPI customization
+# OpenAPI customization; the lifespan freezes the result (see lifespan)
 def custom_openapi():
-    if app.openapi_schema:
-        return app.openapi_schema
     openapi_schema = get_openapi(
         title="MCP (Multi-Control Panel) API",
         version="1.0.0",
@@ -184,7 +623,18 @@ You can:
         routes=app.routes,
     )
     openapi_schema["servers"] = [{"url": "https://notificationspotifymcp.onrender.com"}]
-    app.openapi_schema = openapi_schema
-    return app.openapi_schema
+    return openapi_schema
+
+app.openapi = custom_openapi
+
+@app.get("/openapi.json", include_in_schema=False)
+async def openapi_json():
+    body = getattr(app.state, "openapi_bytes", None)
+    if body is None:  # lifespan hasn't run; encode on first request instead
+        body = app.state.openapi_bytes = orjson.dumps(custom_openapi())
+    return Response(content=body, media_type="application/json")
 
-app.openapi = custom_openapi
\ No newline at end of file
+# FastAPI registers its own /openapi.json in __init__; match ours first
+_openapi_route = next(r for r in app.router.routes if getattr(r, "endpoint", None) is openapi_json)
+app.router.routes.remove(_openapi_route)
+app.router.routes.insert(0, _openapi_route)
@@ -1,7 +1,24 @@
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+def _find_dotenv() -> str:
+    # same search as dotenv.find_dotenv(): upward from this package's directory
+    path = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        candidate = os.path.join(path, ".env")
+        if os.path.isfile(candidate):
+            return candidate
+        parent = os.path.dirname(path)
+        if parent == path:
+            return ""
+        path = parent
+
+# Local development reads a .env file; deployments inject env vars directly,
+# so python-dotenv is only imported when there is a file to load.
+_DOTENV_PATH = _find_dotenv()
+if _DOTENV_PATH:
+    from dotenv import load_dotenv
+
+    load_dotenv(_DOTENV_PATH)
 
 # Spotify credentials (must be set as environment variables on Render or in .env)
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID", "")
@@ -11,6 +28,10 @@ SPOTIFY_REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI", "")
 # Simple owner API key for identity
 AIDAN_API_KEY = os.getenv("AIDAN_API_KEY", "")
 
+# API key -> caller name; add entries here to give more people a named identity.
+# Unset keys are left out so an empty header can never match.
+USER_KEYS = {key: name for key, name in [(AIDAN_API_KEY, "Aidan")] if key}
+
 # Pushover (if you use it)
 PUSHOVER_USER_KEY = os.getenv("PUSHOVER_USER_KEY", "")
 PUSHOVER_API_TOKEN = os.getenv("PUSHOVER_API_TOKEN", "")
@@ -1,4 +1,5 @@
 # mcp.py
+import asyncio
 from tools import thepusherrr as pushover
 from tools import spotify
 import schedule
@@ -7,24 +8,37 @@ import threading
 
 # === Demo Task ===
 
+def _run_spotify(fn, *args):
+    # spotify helpers are async and need the shared HTTP client open
+    async def _main():
+        spotify.open_http()
+        try:
+            return await fn(*args)
+        finally:
+            await spotify.close_http()
+    return asyncio.run(_main())
+
 def notify_hello():
     pushover.send_notification("MCP Test", "hello world")
 
 def play_music():
-    spotify.play_playlist("spotify:playlist:YOUR_PLAYLIST_URI")
+    _run_spotify(spotify.play_playlist, "spotify:playlist:YOUR_PLAYLIST_URI")
 
 def alert_on_specific_song():
-    song, artist = spotify.get_current_song()
+    song, artist = _run_spotify(spotify.get_current_song)
     if song == "YOUR_SONG_NAME":
         pushover.send_notification("🎵 Now Playing", f"{song} by {artist}")
 
 # === Schedule ===
+# Only when run as a script: importing this module must not send a
+# notification or start the scheduler thread.
 
-schedule.every().day.at("09:00").do(play_music)
-schedule.every(30).seconds.do(alert_on_specific_song)
+if __name__ == "__main__":
+    schedule.every().day.at("09:00").do(play_music)
+    schedule.every(30).seconds.do(alert_on_specific_song)
 
-# Optional manual test
-notify_hello()
+    # Optional manual test
+    notify_hello()
 
-# Start scheduler in separate thread
-threading.Thread(target=run_scheduled_tasks).start()
\ No newline at end of file
+    # Start scheduler in separate thread
+    threading.Thread(target=run_scheduled_tasks).start()
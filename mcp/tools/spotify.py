@@ -1,194 +1,529 @@
 import os
+import time
+import asyncio
+import random
 import logging
+import functools
+import threading
 from typing import List, Optional
 
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
+import httpx
+from aiolimiter import AsyncLimiter
+from cachetools import TTLCache
 
 # Configuration from env; expected to be set in your deployment env vars
 CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID", "")
 CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET", "")
 REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI", "")
-SCOPE = ",".join(
-    [
-        "user-read-playback-state",
-        "user-modify-playback-state",
-        "user-read-currently-playing",
-        "playlist-read-private",
-        "playlist-modify-private",
-        "playlist-modify-public",
-        "user-read-email",
-        "user-read-private",
-    ]
+_CREDS_OK = bool(CLIENT_ID and CLIENT_SECRET and REDIRECT_URI)
+_NOT_CONFIGURED = "Spotify credentials (CLIENT_ID/SECRET/REDIRECT_URI) not configured."
+# space-separated, as in Spotify's authorize URL
+SCOPE = (
+    "user-read-playback-state user-modify-playback-state user-read-currently-playing "
+    "playlist-read-private playlist-modify-private playlist-modify-public "
+    "user-read-email user-read-private"
 )
-CACHE_PATH = os.getenv("SPOTIFY_CACHE_PATH", ".spotifycache")  # persistent cache file
+# persistent cache file; resolved once so a later chdir can't move it
+CACHE_PATH = os.path.abspath(os.path.expanduser(os.getenv("SPOTIFY_CACHE_PATH", ".spotifycache")))
+API_BASE = "https://api.spotify.com/v1"
+TOKEN_URL = "https://accounts.spotify.com/api/token"
+TOKEN_REFRESH_MARGIN = 60  # seconds before expiry at which the token is refreshed
+MAX_CONCURRENCY = int(os.getenv("SPOTIFY_MAX_CONCURRENCY", "16"))
+TARGET_LATENCY = float(os.getenv("SPOTIFY_TARGET_LATENCY", "1.0"))  # seconds
+MAX_RETRIES = 3  # retries after the first attempt
+RETRY_BASE_DELAY = 0.5  # seconds; doubled per 5xx/transport retry
+RETRY_BUDGET = 30.0  # seconds of total wall time a call may spend retrying
+_IDEMPOTENT = frozenset({"GET", "PUT", "DELETE"})
+MAX_RATE = float(os.getenv("SPOTIFY_MAX_RATE", "10"))  # requests per second, across all callers
+PAGE_SIZE = 100  # Spotify's max for playlist items
+PLAYLIST_PAGE_SIZE = 50  # Spotify's max for /me/playlists
+PAGE_WINDOW = 8  # pages fetched concurrently while paginating
+SONG_CACHE_TTL = float(os.getenv("SONG_CACHE_TTL", "3"))  # seconds
+RECOMMENDATIONS_CACHE_TTL = float(os.getenv("SPOTIFY_RECOMMENDATIONS_CACHE_TTL", "300"))  # seconds
+PROFILE_CACHE_TTL = float(os.getenv("SPOTIFY_PROFILE_CACHE_TTL", "600"))  # seconds
+PLAYLISTS_CACHE_TTL = float(os.getenv("SPOTIFY_PLAYLISTS_CACHE_TTL", "60"))  # seconds
 
 _logger = logging.getLogger(__name__)
 
 
-def _get_oauth():
-    if not CLIENT_ID or not CLIENT_SECRET or not REDIRECT_URI:
-        raise RuntimeError("Spotify credentials (CLIENT_ID/SECRET/REDIRECT_URI) not configured.")
-    return SpotifyOAuth(
-        client_id=CLIENT_ID,
-        client_secret=CLIENT_SECRET,
-        redirect_uri=REDIRECT_URI,
-        scope=SCOPE,
-        cache_path=CACHE_PATH,
-        show_dialog=False,
-    )
+class NotAuthenticated(RuntimeError):
+    """No usable Spotify token; the owner has to go through /auth/start again."""
+
+
+class _AIMDLimiter:
+    """Caps in-flight Spotify calls, growing the cap additively while calls are
+    fast and halving it on 429/5xx. A Retry-After from Spotify pauses all calls."""
+
+    def __init__(self, limit: int, target_latency: float):
+        self.limit = float(limit)
+        self.ceiling = float(limit)
+        self.target_latency = target_latency
+        self._in_flight = 0
+        self._cond = asyncio.Condition()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+
+    async def acquire(self):
+        # wait out any Retry-After pause before taking a slot, so a task
+        # cancelled during the pause doesn't leave the slot held
+        while (delay := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+        async with self._cond:
+            while self._in_flight >= int(self.limit):
+                await self._cond.wait()
+            self._in_flight += 1
+
+    async def release(self, latency: float, failed: bool, retry_after: Optional[float] = None):
+        now = time.monotonic()
+        if failed:
+            # one decrease per latency window so a burst of failures doesn't collapse the cap
+            if now - self._last_decrease > self.target_latency:
+                self.limit = max(1.0, self.limit * 0.5)
+                self._last_decrease = now
+        elif latency <= self.target_latency:
+            self.limit = min(self.ceiling, self.limit + 1.0 / self.limit)
+        if retry_after:
+            self._paused_until = max(self._paused_until, now + retry_after)
+        async with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+
+# Async client for Web API calls; bound by the app lifespan (see open_http).
+_http: Optional[httpx.AsyncClient] = None
+_owns_http = False
+_limiter: Optional[_AIMDLimiter] = None
+_refresh_lock: Optional[asyncio.Lock] = None
+_rate: Optional[AsyncLimiter] = None
+
+# In-process access token so hot paths skip the cache-file read
+_token_cache = {"token": None, "expires_at": 0.0}
+
+
+def open_http(client: Optional[httpx.AsyncClient] = None) -> httpx.AsyncClient:
+    """Bind the shared app client, or open a private one when none is given."""
+    global _http, _owns_http, _limiter, _refresh_lock, _rate
+    _owns_http = client is None
+    _http = client if client is not None else httpx.AsyncClient(timeout=10.0)
+    _limiter = _AIMDLimiter(MAX_CONCURRENCY, TARGET_LATENCY)
+    # token bucket on top of the concurrency cap: fan-outs (pagination, batch
+    # lookups) can't burst past Spotify's per-app rate limit
+    _rate = AsyncLimiter(MAX_RATE, 1.0)
+    _refresh_lock = asyncio.Lock()
+    return _http
+
+
+async def close_http():
+    global _http
+    if _http is not None and _owns_http:
+        await _http.aclose()
+    _http = None
+
+
+# Built on first use and then reused by the auth endpoints and token refreshes;
+# spotipy is only imported then, so workers that never touch auth skip it.
+_AUTH_MANAGER = None
+_AUTH_LOCK = threading.Lock()  # _get_oauth is also reached from worker threads
 
 
-def _get_client():
-    auth_manager = _get_oauth()
-    token_info = auth_manager.get_cached_token()
-    if not token_info:
-        return None  # caller must trigger auth flow
-    sp = spotipy.Spotify(auth_manager=auth_manager)
-    return sp
+def _get_oauth():
+    global _AUTH_MANAGER
+    if _AUTH_MANAGER is None:
+        if not _CREDS_OK:
+            raise RuntimeError(_NOT_CONFIGURED)
+        with _AUTH_LOCK:
+            if _AUTH_MANAGER is None:
+                from spotipy.oauth2 import SpotifyOAuth
+                from .spotify_cache import MemoryCacheHandler
+
+                _AUTH_MANAGER = SpotifyOAuth(
+                    client_id=CLIENT_ID,
+                    client_secret=CLIENT_SECRET,
+                    redirect_uri=REDIRECT_URI,
+                    scope=SCOPE,
+                    cache_handler=MemoryCacheHandler(CACHE_PATH),
+                    show_dialog=False,
+                )
+    return _AUTH_MANAGER
+
+
+def reset_client():
+    """Drop the process-wide auth manager, cached token and cached reads (for tests)."""
+    global _AUTH_MANAGER
+    with _AUTH_LOCK:
+        _AUTH_MANAGER = None
+    _token_cache["token"] = None
+    _token_cache["expires_at"] = 0.0
+    get_current_song.cache_clear()
+    _recommendations.cache_clear()
+    get_user_profile.cache_clear()
+    get_user_playlists.cache_clear()
 
 
 def get_auth_url() -> str:
-    oauth = _get_oauth()
-    return oauth.get_authorize_url()
+    return _get_oauth().get_authorize_url()
+
+
+def _remember_token(token_info: dict):
+    _token_cache["token"] = token_info["access_token"]
+    _token_cache["expires_at"] = float(token_info.get("expires_at", 0))
 
 
 def handle_callback(code: str) -> dict:
-    oauth = _get_oauth()
-    token_info = oauth.get_access_token(code)
+    token_info = _get_oauth().get_access_token(code, as_dict=True)
+    _remember_token(token_info)
     return token_info
 
 
-def _ensure_client():
-    sp = _get_client()
-    if sp is None:
-        raise RuntimeError("No Spotify token cached. Authenticate via /auth/start and /auth/callback first.")
-    return sp
+def _load_token_info():
+    return _get_oauth().cache_handler.get_cached_token()
+
+
+async def _refresh_token(token_info: dict) -> dict:
+    # same exchange as SpotifyOAuth.refresh_access_token, but on the async client
+    resp = await _http.post(
+        TOKEN_URL,
+        data={"grant_type": "refresh_token", "refresh_token": token_info["refresh_token"]},
+        auth=(CLIENT_ID, CLIENT_SECRET),
+    )
+    if resp.status_code in (400, 401):
+        # invalid_grant: the refresh token was revoked or has expired
+        raise NotAuthenticated("Spotify refresh token rejected. Authenticate via /auth/start again.")
+    resp.raise_for_status()
+    refreshed = resp.json()
+    refreshed["expires_at"] = int(time.time()) + refreshed["expires_in"]
+    refreshed["scope"] = SCOPE
+    refreshed.setdefault("refresh_token", token_info["refresh_token"])
+    await asyncio.to_thread(_get_oauth().cache_handler.save_token_to_cache, refreshed)
+    return refreshed
+
+
+def _fresh_token() -> Optional[str]:
+    if _token_cache["token"] and time.time() < _token_cache["expires_at"] - TOKEN_REFRESH_MARGIN:
+        return _token_cache["token"]
+    return None
+
+
+async def get_token() -> str:
+    token = _fresh_token()
+    if token:
+        return token
+    # one caller reloads/refreshes; the rest wait and reuse its result
+    async with _refresh_lock:
+        token = _fresh_token()
+        if token:
+            return token
+        token_info = await asyncio.to_thread(_load_token_info)
+        if not token_info:
+            raise NotAuthenticated("No Spotify token cached. Authenticate via /auth/start and /auth/callback first.")
+        if token_info.get("expires_at", 0) - time.time() < TOKEN_REFRESH_MARGIN:
+            token_info = await _refresh_token(token_info)
+        _remember_token(token_info)
+        return _token_cache["token"]
+
+
+def _retry_after(resp: httpx.Response) -> float:
+    try:
+        return float(resp.headers.get("Retry-After", 1))
+    except ValueError:
+        return 1.0
+
+
+async def _send(method: str, url: str, token: str, **kwargs) -> httpx.Response:
+    # one attempt, gated by the rate and concurrency limiters
+    limiter = _limiter
+    await _rate.acquire()
+    await limiter.acquire()
+    start = time.perf_counter()
+    resp = None
+    try:
+        resp = await _http.request(method, url, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+    finally:
+        failed = resp is None or resp.status_code == 429 or resp.status_code >= 500
+        retry_after = _retry_after(resp) if resp is not None and resp.status_code == 429 else None
+        await limiter.release(time.perf_counter() - start, failed, retry_after)
+    return resp
+
+
+async def _request(method: str, path: str, **kwargs):
+    if not _CREDS_OK:
+        # fail before the token lock and worker-thread cache read
+        raise RuntimeError(_NOT_CONFIGURED)
+    if _http is None:
+        raise RuntimeError("Spotify HTTP client is not open.")
+    token = await get_token()
+    url = path if path.startswith("https://") else API_BASE + path
+    # a 429 means the call was not processed, so any method may retry it; 5xx and
+    # transport errors are only retried for idempotent methods (no double skips)
+    idempotent = method in _IDEMPOTENT
+    deadline = time.monotonic() + RETRY_BUDGET
+    backoff = RETRY_BASE_DELAY
+    for attempt in range(MAX_RETRIES + 1):
+        error = None
+        retry_after = None
+        try:
+            resp = await _send(method, url, token, **kwargs)
+        except httpx.TransportError as e:
+            if not idempotent or attempt == MAX_RETRIES:
+                raise
+            error = e
+        else:
+            if resp.status_code == 429:
+                retry_after = _retry_after(resp)
+            elif not (resp.status_code >= 500 and idempotent):
+                break
+            if attempt == MAX_RETRIES:
+                break
+        # honor Retry-After exactly; otherwise exponential backoff with jitter
+        if retry_after is not None:
+            wait = retry_after
+        else:
+            wait = backoff * (1 + random.random() * 0.25)
+            backoff *= 2
+        if time.monotonic() + wait > deadline:
+            if error is not None:
+                raise error
+            break
+        await asyncio.sleep(wait)
+    resp.raise_for_status()
+    if resp.status_code == 204 or not resp.content:
+        return None
+    return resp.json()
+
+
+# Bumped by library writes; part of every _ttl_cache key, so one increment
+# invalidates all cached library reads at once.
+_generation = 0
+
+
+def _invalidate():
+    global _generation
+    _generation += 1
+
+
+def _ttl_cache(ttl: float, maxsize: int = 64):
+    """Memoize an async call per argument tuple for ``ttl`` seconds.
+
+    Concurrent misses for the same key share one in-flight fetch. A result is
+    only stored if neither cache_clear() nor _invalidate() ran while it was
+    being fetched, so a read that raced a write can't cache stale data.
+    """
+
+    def decorator(fn):
+        cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        pending: dict = {}
+        epoch = 0  # bumped by cache_clear
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            key = (_generation, args, tuple(sorted(kwargs.items())))
+            try:
+                return cache[key]
+            except KeyError:
+                pass
+            task = pending.get(key)
+            if task is None:
+                task = pending[key] = asyncio.ensure_future(fn(*args, **kwargs))
+                started = epoch
+
+                def store(t, key=key):
+                    if pending.get(key) is t:
+                        del pending[key]
+                    if t.cancelled() or t.exception() is not None:
+                        return
+                    if epoch == started and key[0] == _generation:
+                        cache[key] = t.result()
+
+                task.add_done_callback(store)
+            # shielded: one caller giving up doesn't cancel the others' fetch
+            return await asyncio.shield(task)
+
+        def cache_clear():
+            nonlocal epoch
+            epoch += 1
+            cache.clear()
+            pending.clear()  # later callers start a fresh fetch
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
+
 
+@functools.lru_cache(maxsize=4096)
+def _id_from_uri(uri: str) -> str:
+    # accepts "spotify:<type>:<id>" or a bare id
+    return uri.rpartition(":")[2]
 
-def get_current_song():
-    sp = _ensure_client()
-    playback = sp.current_playback()
+
+async def _playback(method: str, path: str, **kwargs):
+    # playback changes make the cached "now playing" stale
+    result = await _request(method, path, **kwargs)
+    get_current_song.cache_clear()
+    return result
+
+
+@_ttl_cache(SONG_CACHE_TTL, maxsize=1)
+async def get_current_song():
+    playback = await _request("GET", "/me/player")
     if not playback or not playback.get("item"):
         return None, None
     item = playback["item"]
     song = item.get("name")
-    artists = [a.get("name") for a in item.get("artists", [])]
-    artist = ", ".join(artists)
+    # str.join builds a list from a generator anyway, so a list comp is the cheaper input
+    artist = ", ".join([a["name"] for a in item.get("artists") or () if a.get("name")])
     return song, artist
 
 
-def play_playlist(playlist_uri: str):
-    sp = _ensure_client()
-    return sp.start_playback(context_uri=playlist_uri)
+async def play_playlist(playlist_uri: str):
+    return await _playback("PUT", "/me/player/play", json={"context_uri": playlist_uri})
 
 
-def play_song_radio(seed_track_uri: str):
-    sp = _ensure_client()
-    recs = sp.recommendations(seed_tracks=[seed_track_uri], limit=20)
-    uris = [t["uri"] for t in recs.get("tracks", [])]
+async def play_song_radio(seed_track_uri: str):
+    recs = await _recommendations((_id_from_uri(seed_track_uri),), (), (), 20)
+    uris = [t["uri"] for t in recs]
     if not uris:
         return {"error": "no recommendations found"}
-    return sp.start_playback(uris=uris)
+    return await _playback("PUT", "/me/player/play", json={"uris": uris})
 
 
-def play_next_track():
-    sp = _ensure_client()
-    return sp.next_track()
+async def play_next_track():
+    return await _playback("POST", "/me/player/next")
 
 
-def play_track(track_uri: str):
-    sp = _ensure_client()
-    return sp.start_playback(uris=[track_uri])
+async def play_track(track_uri: str):
+    return await _playback("PUT", "/me/player/play", json={"uris": [track_uri]})
 
 
-def resume_playback():
-    sp = _ensure_client()
-    return sp.start_playback()
+async def resume_playback():
+    return await _playback("PUT", "/me/player/play")
 
 
-def pause_playback():
-    sp = _ensure_client()
-    return sp.pause_playback()
+async def pause_playback():
+    return await _playback("PUT", "/me/player/pause")
 
 
-def previous_track():
-    sp = _ensure_client()
-    return sp.previous_track()
+async def previous_track():
+    return await _playback("POST", "/me/player/previous")
 
 
-def set_volume(volume_percent: int):
-    sp = _ensure_client()
-    return sp.volume(volume_percent)
+async def set_volume(volume_percent: int):
+    return await _request("PUT", "/me/player/volume", params={"volume_percent": volume_percent})
 
 
-def search_tracks(query: str, limit: int = 10):
-    sp = _ensure_client()
-    result = sp.search(q=query, type="track", limit=limit)
+async def search_tracks(query: str, limit: int = 10):
+    result = await _request("GET", "/search", params={"q": query, "type": "track", "limit": limit})
     return result.get("tracks", {}).get("items", [])
 
 
-def get_recommendations(
+@_ttl_cache(RECOMMENDATIONS_CACHE_TTL, maxsize=256)
+async def _recommendations(seed_tracks: tuple, seed_artists: tuple, seed_genres: tuple, limit: int) -> list:
+    params = {"limit": limit}
+    if seed_tracks:
+        params["seed_tracks"] = ",".join(seed_tracks)
+    if seed_artists:
+        params["seed_artists"] = ",".join(seed_artists)
+    if seed_genres:
+        params["seed_genres"] = ",".join(seed_genres)
+    recs = await _request("GET", "/recommendations", params=params)
+    return recs.get("tracks") or []
+
+
+async def get_recommendations(
     seed_tracks: Optional[List[str]] = None,
     seed_artists: Optional[List[str]] = None,
     seed_genres: Optional[List[str]] = None,
     limit: int = 10,
 ):
-    sp = _ensure_client()
-    params = {}
-    if seed_tracks:
-        params["seed_tracks"] = seed_tracks[:5]
-    if seed_artists:
-        params["seed_artists"] = seed_artists[:5]
-    if seed_genres:
-        params["seed_genres"] = seed_genres[:5]
-    params["limit"] = limit
-    recs = sp.recommendations(**params)
-    return recs.get("tracks", [])
+    # seeds may be URIs or bare ids; the normalized ids key the cache
+    return await _recommendations(
+        tuple(map(_id_from_uri, (seed_tracks or ())[:5])),
+        tuple(map(_id_from_uri, (seed_artists or ())[:5])),
+        tuple((seed_genres or ())[:5]),
+        limit,
+    )
 
 
-def create_playlist(name: str, description: str = "", public: bool = False):
-    sp = _ensure_client()
-    user = sp.current_user()
+async def create_playlist(name: str, description: str = "", public: bool = False):
+    user = await get_user_profile()
     user_id = user.get("id")
     if not user_id:
         return None
-    return sp.user_playlist_create(user_id, name, public=public, description=description)
-
-
-def add_tracks_to_playlist(playlist_id: str, track_uris: List[str]):
-    sp = _ensure_client()
-    return sp.playlist_add_items(playlist_id, track_uris)
-
-
-def get_user_profile():
-    sp = _ensure_client()
-    return sp.current_user()
-
-
-def get_user_playlists(limit: int = 20):
-    sp = _ensure_client()
-    pls = sp.current_user_playlists(limit=limit)
-    items = pls.get("items", [])
-    return [{"name": p.get("name"), "id": p.get("id"), "uri": p.get("uri")} for p in items]
-
-
-def get_playlist_tracks(playlist_id: str):
-    sp = _ensure_client()
-    all_tracks = []
-    results = sp.playlist_items(playlist_id)
-    all_tracks.extend(results.get("items", []))
-    while results.get("next"):
-        results = sp.next(results)
-        all_tracks.extend(results.get("items", []))
-    simplified = []
-    for entry in all_tracks:
-        t = entry.get("track") or {}
-        simplified.append(
+    playlist = await _request(
+        "POST",
+        f"/users/{user_id}/playlists",
+        json={"name": name, "public": public, "description": description},
+    )
+    _invalidate()
+    return playlist
+
+
+async def add_tracks_to_playlist(playlist_id: str, track_uris: List[str]):
+    result = await _request("POST", f"/playlists/{_id_from_uri(playlist_id)}/tracks", json={"uris": track_uris})
+    _invalidate()
+    return result
+
+
+@_ttl_cache(PROFILE_CACHE_TTL)
+async def get_user_profile():
+    return await _request("GET", "/me")
+
+
+async def _pages(path: str, page_size: int, stop: Optional[int] = None):
+    # async generator over raw offset pages: the first page gives the total,
+    # the rest are fetched in concurrent windows (bounded by the limiters)
+    # and yielded in order. `stop` caps how many items are fetched.
+    results = await _request("GET", path, params={"limit": page_size, "offset": 0})
+    yield results
+    total = results.get("total") or 0
+    if stop is not None:
+        total = min(total, stop)
+    offsets = range(page_size, total, page_size)
+    for i in range(0, len(offsets), PAGE_WINDOW):
+        pages = await asyncio.gather(
+            *[
+                _request("GET", path, params={"limit": page_size, "offset": off})
+                for off in offsets[i : i + PAGE_WINDOW]
+            ]
+        )
+        for results in pages:
+            yield results
+
+
+@_ttl_cache(PLAYLISTS_CACHE_TTL)
+async def get_user_playlists(limit: int = 20):
+    # one request up to Spotify's 50-per-page max; larger limits fan out by offset
+    if limit <= PLAYLIST_PAGE_SIZE:
+        pages = [await _request("GET", "/me/playlists", params={"limit": limit})]
+    else:
+        pages = [page async for page in _pages("/me/playlists", PLAYLIST_PAGE_SIZE, stop=limit)]
+    return [
+        {"name": p.get("name"), "id": p.get("id"), "uri": p.get("uri")}
+        for page in pages
+        for p in page.get("items") or ()
+    ][:limit]
+
+
+def _simplify_tracks(results: dict) -> list:
+    page = []
+    append = page.append
+    for entry in results.get("items") or ():
+        t = entry.get("track")
+        if not t:
+            # removed/unavailable tracks come back as null
+            continue
+        append(
             {
                 "name": t.get("name"),
-                "artists": [a.get("name") for a in t.get("artists", [])],
+                "artists": [a.get("name") for a in t.get("artists") or ()],
                 "uri": t.get("uri"),
+                "id": t.get("id"),
             }
         )
-    return simplified
\ No newline at end of file
+    return page
+
+
+async def get_playlist_tracks(playlist_id: str):
+    # async generator: yields one simplified page (<= 100 tracks) at a time
+    async for results in _pages(f"/playlists/{_id_from_uri(playlist_id)}/tracks", PAGE_SIZE):
+        yield _simplify_tracks(results)
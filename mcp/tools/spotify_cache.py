@@ -0,0 +1,82 @@
+import os
+import json
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+
+from spotipy.cache_handler import CacheFileHandler
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process locking only
+    fcntl = None
+
+_logger = logging.getLogger(__name__)
+
+
+class MemoryCacheHandler(CacheFileHandler):
+    """Token cache that keeps the token in memory and writes through to the file.
+
+    Lookups stat the file and only re-read it when its mtime changed (another
+    worker saved or refreshed the token); otherwise they return the in-memory
+    copy. A miss is never remembered, so a token written later is picked up.
+    Saves update both. Writes go to a temp file that is
+    renamed over the cache, under a thread lock and (on POSIX) an flock on a
+    sidecar lock file, so concurrent refreshes can't leave a torn cache.
+    """
+
+    def __init__(self, cache_path: str):
+        super().__init__(cache_path=cache_path)
+        self._token = None
+        self._mtime = None  # mtime_ns of the file self._token was read from/written to
+        self._lock = threading.RLock()
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.cache_path).st_mtime_ns
+        except OSError:
+            return None
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.cache_path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get_cached_token(self):
+        with self._lock:
+            mtime = self._file_mtime()
+            if mtime is not None and mtime != self._mtime:
+                token = super().get_cached_token()
+                if token is not None:
+                    self._token, self._mtime = token, mtime
+            return self._token
+
+    def save_token_to_cache(self, token_info):
+        with self._lock:
+            self._token = token_info
+            try:
+                with self._file_lock():
+                    self._write_atomic(token_info)
+                    self._mtime = self._file_mtime()
+            except OSError as e:
+                _logger.warning("Couldn't write token to cache at %s: %s", self.cache_path, e)
+
+    def _write_atomic(self, token_info):
+        directory = os.path.dirname(self.cache_path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".spotifycache-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(json.dumps(token_info, cls=self.encoder_cls))
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.cache_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
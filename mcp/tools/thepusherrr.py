@@ -1,22 +1,55 @@
-import os
+import httpx
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from ..config import PUSHOVER_API_TOKEN, PUSHOVER_USER_KEY
 
-def send_notification(title: str, message: str):
+PUSHOVER_URL = "https://api.pushover.net/1/messages.json"
+PUSHOVER_TIMEOUT = (3, 10)  # connect, read
+
+# One pooled session for the sync path so repeat pushes reuse the TLS connection.
+# Only failed connects are retried (the request never left), so a notification
+# is never sent twice.
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=3, connect=3, read=0, status=0, backoff_factor=0.3),
+    ),
+)
+
+def _payload(title: str, message: str) -> dict:
     # validate presence
     if not PUSHOVER_API_TOKEN or not PUSHOVER_USER_KEY:
         raise RuntimeError("Pushover credentials are missing.")
 
-    payload = {
+    return {
         "token": PUSHOVER_API_TOKEN,
         "user": PUSHOVER_USER_KEY,
         "message": message,
         "title": title,
     }
-    resp = requests.post("https://api.pushover.net/1/messages.json", data=payload)
-    try:
-        resp.raise_for_status()
-    except Exception:
+
+def _result(status_code: int, headers, content: bytes) -> dict:
+    # decode the body once and reuse it for both the error and success paths
+    if headers.get("content-type", "").startswith("application/json"):
+        body = orjson.loads(content)
+    else:
+        body = content.decode("utf-8", "replace")
+    if status_code >= 400:
         # bubble error with body for debugging
-        raise RuntimeError(f"Pushover failed: {resp.status_code} {resp.text}")
-    return {"status_code": resp.status_code, "response": resp.json()}
\ No newline at end of file
+        raise RuntimeError(f"Pushover failed: {status_code} {body}")
+    return {"status_code": status_code, "response": body}
+
+def send_notification(title: str, message: str):
+    resp = _SESSION.post(PUSHOVER_URL, data=_payload(title, message), timeout=PUSHOVER_TIMEOUT)
+    return _result(resp.status_code, resp.headers, resp.content)
+
+async def send_notification_async(title: str, message: str, client: httpx.AsyncClient):
+    # the caller's pooled client (the API passes app.state.http), so repeat
+    # pushes skip the TLS handshake and concurrent pushes overlap
+    resp = await client.post(PUSHOVER_URL, data=_payload(title, message))
+    return _result(resp.status_code, resp.headers, resp.content)
@@ -1,86 +1,395 @@
 import os
+import atexit
+import json
+import time
+import hmac
+import secrets
 import logging
-from datetime import datetime
+import logging.handlers
+from datetime import datetime, timedelta
 from typing import Optional
+import queue
 import sqlite3
 import threading
+from collections import defaultdict, deque
+from functools import lru_cache
+
+import orjson
+import redis.asyncio as aioredis
+
+try:
+    import apsw  # optional: thinner SQLite binding, binds and steps in C
+except ImportError:
+    apsw = None
+
+_logger = logging.getLogger(__name__)
 
 # file fallback
+class _ActivityFormatter(logging.Formatter):
+    """Same line layout as "%(asctime)s | user=... | action=... | details=...",
+    built with one f-string; the date part is only re-rendered once a second."""
+
+    _sec = None
+    _stamp = ""
+
+    def format(self, record):
+        sec = int(record.created)
+        if sec != self._sec:
+            self._sec = sec
+            self._stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sec))
+        return (
+            f"{self._stamp},{int(record.msecs):03d} | user={record.user}"
+            f" | action={record.action} | details={record.details}"
+        )
+
+# Off by default: every event already lands in activity_logs.db. Set
+# MCP_FILE_LOG=1 to also get activity.log, or dump the DB when needed:
+#   sqlite3 -separator ' | ' activity_logs.db \
+#     "SELECT timestamp, user, action, details FROM activity_logs" > activity.txt
+_FILE_LOG_ENABLED = os.environ.get("MCP_FILE_LOG", "0") == "1"
 LOG_FILE = os.path.join(os.getcwd(), "activity.log")
 file_logger = logging.getLogger("mcp_activity_file")
 file_logger.setLevel(logging.INFO)
-if not file_logger.handlers:
+if _FILE_LOG_ENABLED and not file_logger.handlers:
     fh = logging.FileHandler(LOG_FILE)
-    formatter = logging.Formatter(
-        "%(asctime)s | user=%(user)s | action=%(action)s | details=%(details)s"
-    )
-    fh.setFormatter(formatter)
-    file_logger.addHandler(fh)
+    fh.setFormatter(_ActivityFormatter())
+    # callers only enqueue the record; the listener thread formats and writes it
+    _file_log_q: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    file_logger.addHandler(logging.handlers.QueueHandler(_file_log_q))
+    _file_listener = logging.handlers.QueueListener(_file_log_q, fh)
+    _file_listener.start()
+    atexit.register(_file_listener.stop)
+
+# --- Timestamps ---
+# Stored as integer microseconds since the epoch (UTC); iso() for display.
+# Queue entries are returned by the API (and persisted in Redis), so their
+# added_at keeps the ISO string format.
+_EPOCH = datetime(1970, 1, 1)
+
+def now_us() -> int:
+    return time.time_ns() // 1000
+
+def iso(ts_us: int) -> str:
+    return (_EPOCH + timedelta(microseconds=ts_us)).isoformat()
 
 # --- Identity helpers ---
+@lru_cache(maxsize=8)
+def _owner_key_bytes(known_owner_key: str) -> bytes:
+    return known_owner_key.strip().encode()
+
 def identify_user(api_key: Optional[str], known_owner_key: str) -> str:
-    if api_key and known_owner_key and api_key.strip() == known_owner_key.strip():
+    # constant-time compare so the owner key can't be probed byte by byte
+    if api_key and known_owner_key and hmac.compare_digest(
+        api_key.strip().encode(), _owner_key_bytes(known_owner_key)
+    ):
         return "Aidan"
     if api_key:
         return f"User({api_key[:6]})"
     return "Anonymous"
 
 # --- In-memory state ---
-STATE: dict[str, dict] = {}
+class QueueFull(Exception):
+    """The user's request queue already holds QUEUE_MAX entries."""
+
+def _new_state() -> dict:
+    # bounded like the Redis queue; add_to_queue rejects once it is full
+    return {"queue": deque(maxlen=QUEUE_MAX), "last_played": None, "online": False}
+
+STATE: defaultdict[str, dict] = defaultdict(_new_state)
 
 def get_user_state(user: str) -> dict:
-    if user not in STATE:
-        STATE[user] = {"queue": [], "last_played": None, "online": False}
     return STATE[user]
 
 def add_to_queue(user: str, track_uri: str, track_name: str, requester: str):
-    st = get_user_state(user)
-    st["queue"].append(
+    q = STATE[user]["queue"]
+    if len(q) >= QUEUE_MAX:
+        raise QueueFull(user)
+    q.append(
         {
             "uri": track_uri,
             "name": track_name,
             "requested_by": requester,
-            "added_at": datetime.utcnow().isoformat(),
+            "added_at": iso(now_us()),
         }
     )
 
 def set_last_played(user: str, track_name: str):
-    st = get_user_state(user)
-    st["last_played"] = {"track": track_name, "timestamp": datetime.utcnow().isoformat()}
+    STATE[user]["last_played"] = {"track": track_name, "timestamp": now_us()}
 
 def set_online(user: str, online: bool):
-    st = get_user_state(user)
-    st["online"] = online
+    STATE[user]["online"] = online
+
+# --- Shared queue (Redis) ---
+# With REDIS_URL set, queues live in a sorted set per user (score = enqueue time)
+# so every worker sees the same queue; otherwise the in-memory STATE is used.
+REDIS_URL = os.getenv("REDIS_URL", "")
+QUEUE_MAX = int(os.getenv("QUEUE_MAX", "500"))
+# atomic check-and-append: only ZADD while the queue is below ARGV[1] entries
+_ENQUEUE_LUA = (
+    "if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[1]) then "
+    "redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3]); return 1 end return 0"
+)
+_redis = None
+_enqueue_script = None
+
+def open_redis():
+    global _redis, _enqueue_script
+    if not REDIS_URL:
+        return None
+    _redis = aioredis.from_url(REDIS_URL)
+    _enqueue_script = _redis.register_script(_ENQUEUE_LUA)
+    return _redis
+
+async def close_redis():
+    global _redis, _enqueue_script
+    if _redis is not None:
+        await _redis.aclose()
+    _redis = None
+    _enqueue_script = None
+
+async def enqueue(user: str, track_uri: str, track_name: str, requester: str) -> list:
+    """Add a request to the user's queue and return the queue contents.
+
+    Raises QueueFull when the queue already holds QUEUE_MAX entries."""
+    if _redis is None:
+        add_to_queue(user, track_uri, track_name, requester)
+        return list(STATE[user]["queue"])
+    key = f"mcp:queue:{user}"
+    entry = {
+        "id": secrets.token_hex(4),
+        "uri": track_uri,
+        "name": track_name,
+        "requested_by": requester,
+        "added_at": iso(now_us()),
+    }
+    if not await _enqueue_script(keys=[key], args=[QUEUE_MAX, time.time(), json.dumps(entry)]):
+        raise QueueFull(user)
+    return [json.loads(m) for m in await _redis.zrange(key, 0, -1)]
 
 # --- SQLite logging backend ---
 DB_PATH = os.path.join(os.getcwd(), "activity_logs.db")
-_DB_LOCK = threading.Lock()
+# WAL + NORMAL: appends don't fsync the whole DB per commit. journal_mode
+# persists in the file; the rest are per-connection.
+_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=268435456;
+PRAGMA cache_size=-65536;
+PRAGMA busy_timeout=3000;
+"""
+
+def _connect() -> sqlite3.Connection:
+    # Both bindings are used in autocommit mode: the only transactions are the
+    # explicit ones in _write_rows, so the rest of the module is binding-agnostic.
+    if apsw is not None:
+        conn = apsw.Connection(DB_PATH, statementcachesize=256)
+        # execute() stops at the first result row (journal_mode returns one)
+        for _ in conn.execute(_PRAGMAS):
+            pass
+        return conn
+    conn = sqlite3.connect(
+        DB_PATH, isolation_level=None, check_same_thread=False, cached_statements=256
+    )
+    conn.executescript(_PRAGMAS)
+    return conn
+
+# One long-lived connection per thread (sqlite3 connections aren't meant to be
+# shared); in WAL mode readers on other threads don't block the writer.
+# The flusher thread is the sole writer (it also creates the schema before
+# its first batch), so writes need no lock of their own.
+_tls = threading.local()
+_CONNS: list[sqlite3.Connection] = []
+_CONNS_LOCK = threading.Lock()
+
+def _get_conn() -> sqlite3.Connection:
+    conn = getattr(_tls, "conn", None)
+    if conn is None:
+        conn = _tls.conn = _connect()
+        with _CONNS_LOCK:
+            _CONNS.append(conn)
+    return conn
+
+def _close_conn():
+    with _CONNS_LOCK:
+        for conn in _CONNS:
+            conn.close()
+        _CONNS.clear()
+
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS activity_logs (
+    id INTEGER PRIMARY KEY,
+    timestamp INTEGER NOT NULL,  -- epoch microseconds
+    user TEXT,
+    action TEXT,
+    details TEXT,
+    origin_ip TEXT,
+    request_headers TEXT,  -- JSON
+    extra TEXT  -- JSON
+)
+"""
+
+# Tables created before timestamps became integers have a TEXT column holding
+# ISO strings ("2026-01-02T03:04:05.123456", fraction omitted at .000000) and,
+# written since, digit strings; both become integer microseconds.
+_MIGRATE_ROWS = """
+INSERT INTO activity_logs
+  (id, timestamp, user, action, details, origin_ip, request_headers, extra)
+SELECT id,
+  CASE WHEN instr(timestamp, '-') = 0 THEN CAST(timestamp AS INTEGER)
+  ELSE CAST(strftime('%s', timestamp) AS INTEGER) * 1000000
+       + CAST(substr(timestamp, 21, 6) AS INTEGER)
+  END,
+  user, action, details, origin_ip, request_headers, extra
+FROM activity_logs_old
+"""
 
 def _ensure_table():
-    with _DB_LOCK:
-        conn = sqlite3.connect(DB_PATH)
+    conn = _get_conn()
+    columns = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(activity_logs)")}
+    if columns and columns.get("timestamp", "").upper() != "INTEGER":
+        # one-time in-place migration of an old TEXT-timestamp table; the old
+        # table (and any indexes on it) is dropped before the indexes below
+        conn.execute("BEGIN IMMEDIATE")
         try:
-            cur = conn.cursor()
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS activity_logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    user TEXT,
-                    action TEXT,
-                    details TEXT,
-                    origin_ip TEXT,
-                    request_headers TEXT,
-                    extra TEXT
-                )
-                """
-            )
-            conn.commit()
-        finally:
-            conn.close()
+            conn.execute("ALTER TABLE activity_logs RENAME TO activity_logs_old")
+            conn.execute(_CREATE_TABLE)
+            conn.execute(_MIGRATE_ROWS)
+            conn.execute("DROP TABLE activity_logs_old")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    else:
+        conn.execute(_CREATE_TABLE)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ts ON activity_logs(timestamp)")
+    # per-user history and per-action lookups without a full table scan
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_ts ON activity_logs(user, timestamp)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_action ON activity_logs(action)")
+
+# kept as one constant so every batch hits the same cached prepared statement
+_INSERT_SQL = (
+    "INSERT INTO activity_logs"
+    " (timestamp, user, action, details, origin_ip, request_headers, extra)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+
+# --- Batched writes ---
+# log_to_sqlite only appends to a bounded ring buffer (deque.append is atomic,
+# no lock) and wakes the flusher through _PENDING. The daemon flusher sleeps
+# until then, waits _FLUSH_INTERVAL so a burst lands in one batch, drains the
+# buffer and commits up to _FLUSH_BATCH rows per transaction. Rows are
+# timestamped when they are drained, once per batch, so times are accurate
+# to ~_FLUSH_INTERVAL.
+# If the flusher falls more than _LOG_BUF_SIZE rows behind, the oldest
+# unwritten rows are dropped; those and failed batches are counted and
+# reported by a warning at most once per _DROP_WARN_INTERVAL.
+_LOG_BUF_SIZE = 65536
+_LOG_BUF: deque = deque(maxlen=_LOG_BUF_SIZE)
+_FLUSH_BATCH = 500
+_FLUSH_INTERVAL = 0.01
+_PENDING = threading.Event()
+_STOP = threading.Event()
+_DROP_WARN_INTERVAL = 60.0
+_DROP_LOCK = threading.Lock()
+_dropped = 0
+_drop_error: Optional[Exception] = None
+_last_drop_warning = 0.0
+
+def _count_dropped(n: int, error: Optional[Exception] = None):
+    global _dropped, _drop_error
+    with _DROP_LOCK:
+        _dropped += n
+        if error is not None:
+            _drop_error = error
+
+def _report_dropped(force: bool = False):
+    # called from the flusher; rate-limited so a failing disk can't flood the log
+    global _dropped, _drop_error, _last_drop_warning
+    now = time.monotonic()
+    if not _dropped or (not force and now - _last_drop_warning < _DROP_WARN_INTERVAL):
+        return
+    with _DROP_LOCK:
+        n, error = _dropped, _drop_error
+        _dropped, _drop_error = 0, None
+    _last_drop_warning = now
+    _logger.warning("activity log dropped %d rows (last error: %s)", n, error)
+
+def _write_rows(rows: list):
+    # only ever called from the flusher thread
+    try:
+        conn = _get_conn()
+        # take the write lock up front, once per batch
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(_INSERT_SQL, rows)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    except Exception as e:
+        # never raised: logging must not break the main flow
+        _count_dropped(len(rows), e)
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug("activity log write failure", exc_info=True)
 
-# ensure table exists at import
-_ensure_table()
+def _drain():
+    popleft = _LOG_BUF.popleft
+    while _LOG_BUF:
+        ts = now_us()
+        rows = []
+        try:
+            while len(rows) < _FLUSH_BATCH:
+                rows.append((ts, *popleft()))
+        except IndexError:
+            pass
+        _write_rows(rows)
+
+def _flusher():
+    try:
+        _ensure_table()
+    except Exception:
+        pass  # the batch writes below fail (and are dropped) the same way
+    while not _STOP.is_set():
+        _PENDING.wait()  # idle: blocks without waking up
+        _PENDING.clear()  # before draining, so rows appended after it re-set it
+        _STOP.wait(_FLUSH_INTERVAL)
+        _drain()
+        _report_dropped()
+    _drain()  # whatever was logged before shutdown
+    _report_dropped(force=True)
+
+# Started by the first log_to_sqlite call rather than at import, so importing
+# this module has no side effects and pre-fork servers (gunicorn --preload)
+# get a flusher in each worker: threads don't survive fork, so is_alive() is
+# False there and the worker's first log starts its own.
+_FLUSHER: Optional[threading.Thread] = None
+_FLUSHER_LOCK = threading.Lock()
+
+def _start_flusher():
+    global _FLUSHER
+    with _FLUSHER_LOCK:
+        if _STOP.is_set() or (_FLUSHER is not None and _FLUSHER.is_alive()):
+            return
+        _FLUSHER = threading.Thread(target=_flusher, name="activity-log-flusher", daemon=True)
+        _FLUSHER.start()
+
+def _shutdown():
+    _STOP.set()
+    _PENDING.set()
+    if _FLUSHER is not None:
+        _FLUSHER.join(timeout=5)
+        if _FLUSHER.is_alive():  # don't pull the connection out from under a write
+            return
+    _close_conn()
+
+atexit.register(_shutdown)
+
+# most events carry no headers/extra; skip the encoder for those
+_EMPTY_JSON = "{}"
 
 def log_to_sqlite(
     user: str,
@@ -90,34 +399,28 @@ def log_to_sqlite(
     headers: Optional[dict] = None,
     extra: Optional[dict] = None,
 ):
-    timestamp = datetime.utcnow().isoformat()
-    with _DB_LOCK:
-        conn = sqlite3.connect(DB_PATH)
-        try:
-            cur = conn.cursor()
-            cur.execute(
-                """
-                INSERT INTO activity_logs
-                  (timestamp, user, action, details, origin_ip, request_headers, extra)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    timestamp,
-                    user,
-                    action,
-                    details,
-                    origin_ip or "",
-                    str(headers or {}),
-                    str(extra or {}),
-                ),
-            )
-            conn.commit()
-        finally:
-            conn.close()
+    if len(_LOG_BUF) >= _LOG_BUF_SIZE:
+        _count_dropped(1)  # the append below evicts the oldest unwritten row
+    _LOG_BUF.append(
+        (
+            user,
+            action,
+            details,
+            origin_ip or "",
+            orjson.dumps(headers, default=str).decode() if headers else _EMPTY_JSON,
+            orjson.dumps(extra, default=str).decode() if extra else _EMPTY_JSON,
+        )
+    )
+    if _FLUSHER is None or not _FLUSHER.is_alive():
+        _start_flusher()
+    # is_set() is a plain read; only the first row after a drain pays for set()
+    if not _PENDING.is_set():
+        _PENDING.set()
 
 def log_action(user: str, action: str, details: str, origin_ip: Optional[str] = None, headers: Optional[dict] = None, extra: Optional[dict] = None):
     # file fallback (for local readable)
-    file_logger.info("", extra={"user": user, "action": action, "details": details})
+    if _FILE_LOG_ENABLED:
+        file_logger.info("", extra={"user": user, "action": action, "details": details})
     # sqlite persistence
     try:
         log_to_sqlite(user, action, details, origin_ip=origin_ip, headers=headers, extra=extra)
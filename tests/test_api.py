@@ -0,0 +1,20 @@
+import sqlite3
+
+from fastapi.testclient import TestClient
+
+
+def test_action_log_survives_repeated_lifespans(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from mcp import api
+
+    db_path = tmp_path / "actions.db"
+    monkeypatch.setattr(api, "DB_PATH", str(db_path))
+
+    # each session runs the lifespan on a fresh event loop
+    for _ in range(2):
+        with TestClient(api.app) as client:
+            assert client.get("/").status_code == 200
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT endpoint FROM action_log").fetchall()
+    assert rows == [("health_check",), ("health_check",)]